@@ -0,0 +1,185 @@
+# checks of game rules on known positions, run with: python3 checks.py
+
+from elements import *
+from selfplay import uciToMove
+import explorer
+import os
+import selfplay
+import tempfile
+
+
+def setup(pieces, hasToMove = Color.WHITE):
+    "Create a game from a list of (color, piece class, coords)"
+    game = Game(empty = True)
+    for color, piece, coords in pieces:
+        game.players[color].pieces.append(piece(game, color, coords))
+    game.hasToMove = hasToMove
+    game.recordPosition()
+
+    return game
+
+
+def play(game, moves):
+    for moveStr in moves.split():
+        game.move(*uciToMove(moveStr))
+        game.opponentToPlay()
+
+    return game
+
+
+def checkPromotion():
+    game = setup([
+        (Color.WHITE, King, ('e', '1')),
+        (Color.BLACK, King, ('h', '8')),
+        (Color.WHITE, Pawn, ('b', '7')),
+    ])
+    pawn = game.board.squares[('b', '7')].piece
+    play(game, 'b7b8q')
+
+    queen = game.board.squares[('b', '8')].piece
+    assert type(queen) is Queen and queen.color is Color.WHITE
+    assert queen in game.players[Color.WHITE].pieces
+    assert pawn not in game.players[Color.WHITE].pieces
+
+
+def checkPawnCannotJump():
+    game = setup([
+        (Color.WHITE, King, ('e', '1')),
+        (Color.BLACK, King, ('e', '8')),
+        (Color.WHITE, Pawn, ('d', '2')),
+        (Color.BLACK, Knight, ('d', '3')),
+    ])
+    pawn = game.board.squares[('d', '2')].piece
+    squares = [ square.coords for square in pawn.possibleMoves() ]
+
+    assert ('d', '3') not in squares and ('d', '4') not in squares
+
+
+def checkEnPassant():
+    # one square step does not allow en passant
+    game = setup([
+        (Color.WHITE, King, ('e', '1')),
+        (Color.BLACK, King, ('e', '8')),
+        (Color.WHITE, Pawn, ('g', '2')),
+        (Color.BLACK, Pawn, ('h', '3')),
+    ])
+    play(game, 'g2g3')
+    assert ('h', '3') not in [ piece.square.coords for piece, square in game.players[Color.BLACK].iterLegalMoves() \
+        if square.coords == ('g', '3') ]
+    assert game.positionKey().endswith(' -')
+
+    # two squares step allows en passant, which removes the pawn
+    game = setup([
+        (Color.WHITE, King, ('e', '1')),
+        (Color.BLACK, King, ('e', '8')),
+        (Color.WHITE, Pawn, ('e', '5')),
+        (Color.BLACK, Pawn, ('d', '7')),
+    ], Color.BLACK)
+    play(game, 'd7d5')
+    assert game.positionKey().endswith(' d6')
+    play(game, 'e5d6')
+    assert game.board.squares[('d', '5')].piece is None
+    assert len(game.players[Color.BLACK].pieces) == 1
+
+    # en passant would expose the king to the rook along the line
+    game = setup([
+        (Color.WHITE, King, ('a', '5')),
+        (Color.BLACK, King, ('e', '8')),
+        (Color.WHITE, Pawn, ('b', '5')),
+        (Color.BLACK, Pawn, ('c', '7')),
+        (Color.BLACK, Rook, ('h', '5')),
+    ], Color.BLACK)
+    play(game, 'c7c5')
+    assert ('c', '6') not in [ square.coords for piece, square in game.players[Color.WHITE].iterLegalMoves() ]
+    assert game.positionKey().endswith(' -')
+
+
+def checkRepetition():
+    game = Game()
+    play(game, 'g1f3 g8f6 f3g1 f6g8 g1f3 g8f6 f3g1')
+    assert not game.drawByRepetition()
+
+    # third occurrence of the initial position
+    play(game, 'f6g8')
+    assert game.drawByRepetition()
+
+
+def checkMates():
+    assert play(Game(), 'f2f3 e7e5 g2g4 d8h4').currentPlayerCheckmated()
+
+    # back rank mate
+    game = setup([
+        (Color.BLACK, King, ('h', '8')),
+        (Color.BLACK, Pawn, ('g', '7')),
+        (Color.BLACK, Pawn, ('h', '7')),
+        (Color.WHITE, Rook, ('a', '8')),
+        (Color.WHITE, King, ('a', '1')),
+    ], Color.BLACK)
+    assert game.currentPlayerCheckmated() and not game.currentPlayerInStalemate()
+
+    # only square left to the king, c4, stays on the checking rook line
+    game = setup([
+        (Color.BLACK, King, ('d', '4')),
+        (Color.WHITE, Rook, ('h', '4')),
+        (Color.WHITE, Rook, ('a', '3')),
+        (Color.WHITE, Rook, ('a', '5')),
+        (Color.WHITE, King, ('h', '1')),
+    ], Color.BLACK)
+    assert game.currentPlayerCheckmated()
+
+
+def checkStalemate():
+    game = setup([
+        (Color.BLACK, King, ('a', '8')),
+        (Color.WHITE, Queen, ('b', '6')),
+        (Color.WHITE, King, ('c', '5')),
+    ], Color.BLACK)
+    assert game.currentPlayerInStalemate() and not game.currentPlayerCheckmated()
+
+
+def checkSelfPlay():
+    "Games played from fixed seeds must not change"
+    games = [
+        # selector, seed, maximum plies, result, termination, plies, first moves, last moves
+        (selfplay.RandomSelector, 0, 60, '*', 'plies', 60, 'f2f3 f7f6 a2a4 d7d5', 'd1d2 g7g6'),
+        (selfplay.RandomSelector, 1, 60, '*', 'plies', 60, 'b2b3 h7h5 b1a3 d7d5', 'g5g6 b2d2'),
+        (selfplay.RandomSelector, 2, 60, '*', 'plies', 60, 'a2a4 b7b5 a4a5 e7e6', 'c5d6 d8d7'),
+        (selfplay.RandomSelector, 3, 60, '*', 'plies', 60, 'c2c4 h7h5 g1h3 b8a6', 'd2c1 f6g7'),
+        (selfplay.GreedySelector, 65, 150, '0-1', 'checkmate', 10, 'f2f4 d7d6 d2d4 e7e6', 'g3h4 e7h4'),
+        (selfplay.GreedySelector, 51, 150, '0-1', 'checkmate', 40, 'c2c4 g8f6 g2g3 b8c6', 'b3c4 a1c1'),
+        (selfplay.GreedySelector, 21, 150, '1/2-1/2', 'stalemate', 70, 'b2b4 f7f6 f2f3 d7d6', 'f4f5 c8f5'),
+        (selfplay.GreedySelector, 52, 150, '1/2-1/2', 'material', 100, 'd2d3 a7a6 g2g4 h7h5', 'a2e6 f4e5'),
+        (selfplay.BookSelector, 0, 30, '*', 'plies', 30, 'e2e4 e7e5 g1f3 b8c6', 'e5d3 h5g4'),
+        (selfplay.BookSelector, 1, 30, '*', 'plies', 30, 'd2d4 g8f6 c2c4 g7g6', 'a8b6 e5c4'),
+    ]
+
+    for selector, seed, maxPlies, result, termination, plies, first, last in games:
+        played = selfplay.playGame(seed, selector(), maxPlies)
+        expected = (result, termination, plies, first, last)
+        actual = (played[0], played[1], len(played[2]), ' '.join(played[2][:4]), ' '.join(played[2][-2:]))
+
+        assert actual == expected, '{} seed {}: {} instead of {}'.format(selector.__name__, seed, actual, expected)
+
+
+def checkExplorer():
+    corpus = [
+        '7 0-1 checkmate e2e4 e7e5 e1e3 d7d5',
+        '8 1/2-1/2 repetition g1f3 g8f6 f3g1 f6g8 g1f3 g8f6 f3g1 f6g8',
+    ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'games.idx')
+        explorer.build(corpus, path)
+
+        with explorer.OpeningIndex(path) as index:
+            # illegal king move is not counted
+            assert index.lookup(play(Game(), 'e2e4 e7e5')) == []
+            # a repeated position counts its game once
+            assert index.lookup(Game()) == [ ('e2e4', 1, 0, 0, 1), ('g1f3', 1, 0, 1, 0) ]
+
+
+if __name__ == '__main__':
+    for name, check in list(globals().items()):
+        if name.startswith('check'):
+            check()
+            print('{}: ok'.format(name))
@@ -1,6 +1,7 @@
 # cli interface to play chess
 
 from elements import *
+import selfplay
 import re
 import getopt
 import sys
@@ -91,6 +92,13 @@ def usage():
     print ('Help message : -h or --help' )
     print ('Play moves : -m "e2e4 e7e5 g1f3…"  or  --moves="e2e4 e7e5 g1f3…"' )
     print ('Set initial position : -p "bka8 wqb6 wkc5 w"  or  --position="bka8 wqb6 wkc5 w"' )
+    print ('Play games automatically : -s 1000  or  --selfplay=1000' )
+    print ('    --selector=random|greedy|book  move selection (default random)' )
+    print ('    --book=book.txt  weighted opening lines used by book selector' )
+    print ('    --workers=4  number of processes (default number of cpus)' )
+    print ('    --seed=0  seed of the first game, next games use following seeds' )
+    print ('    --max-plies=400  stop unfinished games after this number of half moves' )
+    print ('    --output=games.txt  file where games are written (default standard output)' )
 
 
 def printError():
@@ -98,93 +106,133 @@ def printError():
     usage()
 
 
-# parse options
-try:
-    opts, arg = getopt.getopt(sys.argv[1:], "hm:p:", ["help", "moves=", "position="])
-except getopt.GetoptError:
-    printError()
-    sys.exit(2)
+if __name__ == '__main__':
+    # parse options
+    try:
+        opts, arg = getopt.getopt(sys.argv[1:], "hm:p:s:", ["help", "moves=", "position=", "selfplay=",
+            "selector=", "book=", "workers=", "seed=", "max-plies=", "output="])
+    except getopt.GetoptError:
+        printError()
+        sys.exit(2)
 
-manualInput = True
+    manualInput = True
+    selfplayOptions = {}
 
-for opt, arg in opts:
-    if opt in [ '-h', '--help' ]:
-        usage()
-        sys.exit(0)
-    if opt in [ '-m', '--moves' ]:
-        moves = validateMovesSyntax(arg)
+    for opt, arg in opts:
+        if opt in [ '-h', '--help' ]:
+            usage()
+            sys.exit(0)
+        if opt in [ '-m', '--moves' ]:
+            moves = validateMovesSyntax(arg)
 
-        if not moves:
-            printError()
-            sys.exit(2)
+            if not moves:
+                printError()
+                sys.exit(2)
 
-        manualInput = False
+            manualInput = False
 
-    if opt in [ '-p', '--position' ]:
-        positions = validatePositionSyntax(arg)
+        if opt in [ '-p', '--position' ]:
+            positions = validatePositionSyntax(arg)
 
-        if not positions:
-            printError()
-            sys.exit(2)
+            if not positions:
+                printError()
+                sys.exit(2)
 
-        game = Game(empty = True)
+            game = Game(empty = True)
 
-        for i in range(0, len(positions)):
-            if i == len(positions) - 1:
-                game.hasToMove = Color.WHITE if positions[i] is 'w' else Color.BLACK
-            else:
-                color = Color.WHITE if positions[i][0] is 'w' else Color.BLACK
-                game.players[color].pieces.append(tokens[positions[i][1]](game, color, (positions[i][2])))
-
-        pass
-
-if not 'game' in locals():
-    game = Game()
-
-end = False
-nMove = 0
-while not end:
-    print()
-    printGame(game)
-    print()
-    moved = False
-    while not end and not moved:
-        if game.currentPlayerInStalemate():
-            print(('White' if game.hasToMove is Color.WHITE else 'Black') + ' player in stalemate!')
-            print("It's a draw")
-            end = True
-            break
-
-        if game.currentPlayerCheckmated():
-            print(('White' if game.hasToMove is Color.WHITE else 'Black') + ' player is checkmated!')
-            print(('Black' if game.hasToMove is Color.WHITE else 'White') + ' player wins!')
-            end = True
-            break
-        if game.currentPlayerInCheck():
-            print(('White' if game.hasToMove is Color.WHITE else 'Black') + ' player in check!')
-
-        if not manualInput and nMove == len(moves):
-            print('This is the last defined move')
-            print()
-            manualInput = True
-
-        if manualInput:
-            moved = inputMove(game)
+            for i in range(0, len(positions)):
+                if i == len(positions) - 1:
+                    game.hasToMove = Color.WHITE if positions[i] is 'w' else Color.BLACK
+                else:
+                    color = Color.WHITE if positions[i][0] is 'w' else Color.BLACK
+                    game.players[color].pieces.append(tokens[positions[i][1]](game, color, (positions[i][2])))
+
+            game.recordPosition()
+
+        if opt in [ '-s', '--selfplay', '--workers', '--seed', '--max-plies' ]:
+            if not re.search(r"^\d+$", arg):
+                printError()
+                sys.exit(2)
+
+            selfplayOptions[opt.lstrip('-')] = int(arg)
+
+        if opt in [ '--selector', '--book', '--output' ]:
+            if opt == '--selector' and arg not in selfplay.selectors:
+                printError()
+                sys.exit(2)
+
+            selfplayOptions[opt.lstrip('-')] = arg
+
+    if 's' in selfplayOptions or 'selfplay' in selfplayOptions:
+        selector = selfplay.selectors[selfplayOptions.get('selector', 'random')]
+        if selector is selfplay.BookSelector and 'book' in selfplayOptions:
+            selector = selfplay.BookSelector.load(selfplayOptions['book'])
         else:
-            token = None
-            for i, piece in tokens.items():
-                if piece == moves[nMove][2]:
-                    token = i
-                    break
-
-            print('Move: {}{}'.format(*moves[nMove][0]) \
-                + '{}{}'.format(*moves[nMove][1]) \
-                + ('{}'.format(token) if token else ''))
-            moved = move(game, (moves[nMove][0], moves[nMove][1]), moves[nMove][2])
-
-        if moved:
-            game.opponentToPlay()
-            nMove += 1
-        elif not manualInput:
-            print ('Some moves are wrong. Exit.')
-            sys.exit(2)
+            selector = selector()
+
+        output = open(selfplayOptions['output'], 'w') if 'output' in selfplayOptions else sys.stdout
+
+        selfplay.generate(selfplayOptions.get('s', selfplayOptions.get('selfplay')), output, selector,
+            workers = selfplayOptions.get('workers') or None,
+            seed = selfplayOptions.get('seed', 0),
+            maxPlies = selfplayOptions.get('max-plies', 400))
+
+        output.close()
+        sys.exit(0)
+
+    if not 'game' in locals():
+        game = Game()
+
+    end = False
+    nMove = 0
+    while not end:
+        print()
+        printGame(game)
+        print()
+        moved = False
+        while not end and not moved:
+            if game.currentPlayerInStalemate():
+                print(('White' if game.hasToMove is Color.WHITE else 'Black') + ' player in stalemate!')
+                print("It's a draw")
+                end = True
+                break
+
+            if game.currentPlayerCheckmated():
+                print(('White' if game.hasToMove is Color.WHITE else 'Black') + ' player is checkmated!')
+                print(('Black' if game.hasToMove is Color.WHITE else 'White') + ' player wins!')
+                end = True
+                break
+
+            if game.draw():
+                print("It's a draw")
+                end = True
+                break
+
+            if game.currentPlayerInCheck():
+                print(('White' if game.hasToMove is Color.WHITE else 'Black') + ' player in check!')
+
+            if not manualInput and nMove == len(moves):
+                print('This is the last defined move')
+                print()
+                manualInput = True
+
+            if manualInput:
+                moved = inputMove(game)
+            else:
+                token = None
+                for i, piece in tokens.items():
+                    if piece == moves[nMove][2]:
+                        token = i
+                        break
+
+                print('Move: {}{}'.format(*moves[nMove][0]) \
+                    + '{}{}'.format(*moves[nMove][1]) \
+                    + ('{}'.format(token) if token else ''))
+                moved = move(game, (moves[nMove][0], moves[nMove][1]), moves[nMove][2])
+
+            if moved:
+                game.opponentToPlay()
+                nMove += 1
+            elif not manualInput:
+                print ('Some moves are wrong. Exit.')
+                sys.exit(2)
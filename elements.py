@@ -64,23 +64,30 @@ class Piece:
         return self.player().opponent()
 
 
+    def possibleMoves(self, control = False):
+        return list(self.iterMoves(control))
+
+    def capturedSquare(self, square):
+        "Square of the piece captured by moving to square"
+        return square
+
     def moveTo(self, coords, validate = True, tryMove = False, countMove = True, promote = None):
-        if validate and ( \
-            self.possibleMoves() is None or self.board.squares[coords] not in self.possibleMoves()):
+        if validate and self.board.squares[coords] not in self.iterMoves():
             return False
 
         originSquare = self.square
         destinationSquare = self.board.squares[coords]
-        opponentPiece = destinationSquare.piece
+        capturedSquare = self.capturedSquare(destinationSquare)
+        opponentPiece = capturedSquare.piece
 
         originSquare.piece = None
         self.square = destinationSquare
 
 
-        # delete piece if there is a piece of the square
+        # delete captured piece, before checking whether the king is in check
         if opponentPiece is not None:
-            self.opponent().remove(destinationSquare.piece)
-            destinationSquare.piece = None
+            self.opponent().remove(opponentPiece)
+            capturedSquare.piece = None
         destinationSquare.piece = self
 
         # check if player's king is in check, in which case movement is illegal
@@ -90,12 +97,11 @@ class Piece:
             originSquare.piece = self
 
             # cancel move
+            destinationSquare.piece = None
             if opponentPiece is not None:
-                opponentPiece.square = destinationSquare
-                destinationSquare.piece = opponentPiece
+                opponentPiece.square = capturedSquare
+                capturedSquare.piece = opponentPiece
                 self.opponent().cancelRemove(opponentPiece)
-            else:
-                destinationSquare.piece = None
 
             return not check if validate else True
 
@@ -114,26 +120,22 @@ class Piece:
 
         return (column, row)
 
-    def recursiveAddCoords(self, list, coords, move, control = False):
-        "Add coords to a list of possible moves while squares are free"
-        newCoords = self.newCoords(move, coords)
-
-        # returns list if there is no further existing square, or if square is occupied
-        # by a piece of a same color
-        if not newCoords:
-            return list
+    def iterRay(self, move, control = False):
+        "Generates squares in a direction while squares are free"
+        coords = self.newCoords(move)
 
-        # returns list if square is occupied by a piece of the same color
-        piece = self.board.squares[newCoords].piece
-        if piece:
-            if control or piece.color is not self.color:
-                list.append(newCoords)
+        # stop if there is no further existing square
+        while coords:
+            square = self.board.squares[coords]
 
-            return list
+            # stop on an occupied square, which is reachable only if occupied by an opponent piece
+            if square.piece:
+                if control or square.piece.color is not self.color:
+                    yield square
+                return
 
-        list.append(newCoords)
-
-        return self.recursiveAddCoords(list, newCoords, move, control)
+            yield square
+            coords = self.newCoords(move, coords)
 
     def remove(self):
         self.square = None
@@ -141,33 +143,27 @@ class Piece:
 
 
 class King(Piece):
-    def possibleMoves(self, control = False):
-        opponentColor = Color.opponent(self.color)
+    def iterMoves(self, control = False):
+        opponentKingSquares = self.opponent().king().adjacentSquares()
 
-        # filter among adjacent squares
-        possibleMoves = self.adjacentSquares()
+        for square in self.adjacentSquares():
+            # keep only free squares and squares occupied par an opponent piece (or friend pieces too if control)
+            if square.piece and not control and square.piece.color is self.color:
+                continue
 
-        # keep only free squares and squares occupied par an opponent piece (or friend pieces too if control)
-        possibleMoves = [ square for square in possibleMoves if not square.piece \
-            or (square.piece and control) \
-            or (square.piece and square.piece.color is opponentColor) \
-        ]
+            # exclude squares adjacent from opponent king
+            if square in opponentKingSquares:
+                continue
 
-        # check whether squares are controlled by opponent. Exclude king from computation to avoid infinite recursion loop
-        possibleMoves = [
-            square for square in possibleMoves if not square.controlledBy(self.opponent(), excludeKing = True)
-        ]
+            # check whether squares are controlled by opponent. Exclude king from computation to avoid infinite recursion loop
+            if square.controlledBy(self.opponent(), excludeKing = True):
+                continue
+
+            yield square
 
         # castling possible squares are not controlled
         if not control:
-            possibleMoves += self.castlingPossibleMoves()
-
-        # exclude squares adjacent from opponent king
-        possibleMoves = [
-            square for square in possibleMoves if not square in self.opponent().king().adjacentSquares()
-        ]
-
-        return possibleMoves
+            yield from self.castlingPossibleMoves()
 
 
     def castlingPossibleMoves(self):
@@ -213,9 +209,6 @@ class King(Piece):
     def inCheck(self):
         return self.square.controlledBy(self.opponent(), excludeKing = True)
 
-    def checkmated(self):
-        return self.inCheck() and not self.possibleMoves()
-
     def adjacentSquares(self):
         # search for theorical possibles squares
         adjacents = [
@@ -237,7 +230,8 @@ class King(Piece):
 
 
     def moveTo(self, coords, validate = True, tryMove = False, countMove = True, promote = None):
-        castlingMoves = self.castlingPossibleMoves()
+        # a tried move is cancelled, rook never has to move
+        castlingMoves = self.castlingPossibleMoves() if not tryMove else []
 
         move = Piece.moveTo(self, coords, validate, tryMove, countMove)
 
@@ -254,95 +248,63 @@ class King(Piece):
 
 
 class Queen(Piece):
-    def possibleMoves(self, control = False):
-        return Rook.possibleMoves(self, control) + Bishop.possibleMoves(self, control)
+    def iterMoves(self, control = False):
+        yield from Rook.iterMoves(self, control)
+        yield from Bishop.iterMoves(self, control)
 
 
 class Bishop(Piece):
-    def possibleMoves(self, control = False):
-        coords = self.square.coords
-        possibleMoves = []
-        possibleMoves = self.recursiveAddCoords(possibleMoves, coords, (1, 1), control)
-        possibleMoves = self.recursiveAddCoords(possibleMoves, coords, (1, -1), control)
-        possibleMoves = self.recursiveAddCoords(possibleMoves, coords, (-1, -1), control)
-        possibleMoves = self.recursiveAddCoords(possibleMoves, coords, (-1, 1), control)
-
-        possibleMoves = [ self.board.squares[coords] for coords in possibleMoves ]
-
-        return possibleMoves
+    def iterMoves(self, control = False):
+        for move in [(1, 1), (1, -1), (-1, -1), (-1, 1)]:
+            yield from self.iterRay(move, control)
 
 
 class Knight(Piece):
-    def possibleMoves(self, control = False):
-        coords = self.square.coords
-
-        # search for theorical possibles squares
-        possibleMoves = [
-            self.newCoords((1, 2)),
-            self.newCoords((2, 1)),
-            self.newCoords((2, -1)),
-            self.newCoords((1, -2)),
-            self.newCoords((-1, -2)),
-            self.newCoords((-2, -1)),
-            self.newCoords((-2, 1)),
-            self.newCoords((-1, 2)),
-        ]
-
-        # remove non existent squares
-        possibleMoves = [ move for move in possibleMoves if move ]
-
-        # change coords into squares
-        possibleMoves = [ self.board.squares[coords] for coords in possibleMoves ]
+    def iterMoves(self, control = False):
+        # search among theorical possibles squares
+        for move in [(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)]:
+            coords = self.newCoords(move)
 
-        # keep only free squares and squares occupied par an opponent piece (or friend pieces too if control)
-        possibleMoves = [ square for square in possibleMoves if not square.piece \
-            or (square.piece and control) \
-            or (square.piece and square.piece.color != self.color) ]
+            # skip non existent squares
+            if not coords:
+                continue
 
-        return possibleMoves
+            # keep only free squares and squares occupied par an opponent piece (or friend pieces too if control)
+            square = self.board.squares[coords]
+            if not square.piece or control or square.piece.color != self.color:
+                yield square
 
 
 class Rook(Piece):
-    def possibleMoves(self, control = False):
-        coords = self.square.coords
-        possibleMoves = []
-        possibleMoves = self.recursiveAddCoords(possibleMoves, coords, (0, 1), control)
-        possibleMoves = self.recursiveAddCoords(possibleMoves, coords, (1, 0), control)
-        possibleMoves = self.recursiveAddCoords(possibleMoves, coords, (0, -1), control)
-        possibleMoves = self.recursiveAddCoords(possibleMoves, coords, (-1, 0), control)
-
-        possibleMoves = [ self.board.squares[coords] for coords in possibleMoves ]
-
-        return possibleMoves
+    def iterMoves(self, control = False):
+        for move in [(0, 1), (1, 0), (0, -1), (-1, 0)]:
+            yield from self.iterRay(move, control)
 
 
 class Pawn(Piece):
-    def possibleMoves(self, control = False):
-        coords = self.square.coords
-        possibleMoves = []
+    def iterMoves(self, control = False):
         direction = 1 if self.color is Color.WHITE else -1
 
+        for move in [(-1, 1 * direction), (1, 1 * direction)]:
+            newCoords = self.newCoords(move)
+            if newCoords and self.board.squares[newCoords].piece and \
+                (control or self.board.squares[newCoords].piece.color != self.color):
+                yield self.board.squares[newCoords]
+
         # forward squares and "en passant" are not controlled
         if not control:
+            yield from self.enPassantMoves()
+
             forward = self.newCoords((0, 1 * direction))
 
             if forward and self.board.squares[forward].piece is None:
-                possibleMoves.append(self.board.squares[forward])
-
-            forward2 = self.newCoords((0, 2 * direction))
+                yield self.board.squares[forward]
 
-            if self.nbMoves == 0 and forward2 and self.board.squares[forward2].piece is None:
-                possibleMoves.append(self.board.squares[forward2])
+                # pawn cannot jump over a piece
+                forward2 = self.newCoords((0, 2 * direction))
 
-            possibleMoves += self.enPassantMoves()
-
-        for move in [(-1, 1 * direction), (1, 1 * direction)]:
-            newCoords = self.newCoords(move)
-            if newCoords and self.board.squares[newCoords].piece and \
-                (control or self.board.squares[newCoords].piece.color != self.color):
-                possibleMoves.append(self.board.squares[newCoords])
-
-        return list(set(possibleMoves)) # deduplicate
+                if self.nbMoves == 0 and forward2 and self.board.squares[forward2].piece is None:
+                    yield self.board.squares[forward2]
 
 
     def enPassantMoves(self):
@@ -360,25 +322,30 @@ class Pawn(Piece):
 
             beside = self.board.squares[beside]
 
+            # opponent pawn has just moved two squares, from its pawns line to beside this pawn
             if beside.piece and beside.piece.color is Color.opponent(self.color) \
-                and type(beside.piece).__name__ is 'Pawn' and lastMove.piece is beside.piece \
-                and lastMove.origin[1] is self.opponent().pawnsLine:
+                and type(beside.piece) is Pawn and lastMove.piece is beside.piece \
+                and lastMove.origin[1] == self.opponent().pawnsLine \
+                and lastMove.destination == beside.coords \
+                and abs(int(lastMove.destination[1]) - int(lastMove.origin[1])) == 2:
                 possibleMoves.append( \
                     self.board.squares[(beside.coords[0], '3' if self.opponent().color is Color.WHITE else '6')])
 
         return possibleMoves
 
+    def capturedSquare(self, square):
+        "En passant captures the pawn beside, on the same line"
+        if square in self.enPassantMoves():
+            return self.board.squares[(square.coords[0], self.square.coords[1])]
+
+        return square
+
     def moveTo(self, coords, validate = True, tryMove = False, countMove = True, promote = None):
         if coords[1] in [ '1', '8' ] and not promote and (validate and not tryMove):
             return False
 
-        enPassantMoves = self.enPassantMoves()
-
         move = Piece.moveTo(self, coords, validate, tryMove, countMove, promote)
 
-        if self.square in enPassantMoves:
-            self.board.squares[self.newCoords((0, -1 if self.color is Color.WHITE else 1))].removePiece()
-
         if self.square.coords[1] in ['1', '8']:
             "promote"
 
@@ -422,19 +389,15 @@ class Player:
 
         return self.cantMove()
 
-    def controlledSquares(self, excludeKing = False):
+    def controls(self, square, excludeKing = False):
         # ability to exclude king from computation to avoid infinite recursion loop
-        squares = []
         for piece in self.pieces:
             if excludeKing and type(piece) is King:
                 continue
-            squares += piece.possibleMoves(control = True)
+            if square in piece.iterMoves(control = True):
+                return True
 
-        return list(set(squares))
-
-    def controls(self, square, excludeKing = False):
-        # ability to exclude king from computation to avoid infinite recursion loop
-        return square in self.controlledSquares(excludeKing)
+        return False
 
     def remove(self, piece):
         self.removed.append(piece)
@@ -454,12 +417,36 @@ class Player:
         return self.cantMove()
 
     def cantMove(self):
-        for piece in self.pieces:
-            for move in piece.possibleMoves():
-                if piece.moveTo(move.coords, tryMove = True):
-                    return False
+        for move in self.iterLegalMoves():
+            return False
+
+        return True
+
+    def iterLegalMoves(self):
+        """Generates legal moves as (piece, square), king moves first, then captures, then quiet moves.
+
+        Each move is tried on the board and cancelled before being generated: callers must not
+        play a move until the generator is exhausted or dropped."""
+        pieces = list(self.pieces)
+        king = self.king()
+
+        for square in king.iterMoves():
+            if king.moveTo(square.coords, tryMove = True):
+                yield king, square
+
+        for captures in [ True, False ]:
+            for piece in pieces:
+                if piece is king:
+                    continue
 
-        return not self.king().possibleMoves()
+                enPassantMoves = piece.enPassantMoves() if type(piece) is Pawn else []
+
+                for square in piece.iterMoves():
+                    capture = (square.piece is not None and square.piece.color is not self.color) \
+                        or square in enPassantMoves
+
+                    if capture is captures and piece.moveTo(square.coords, tryMove = True):
+                        yield piece, square
 
 class Move:
     def __init__(self, piece, origin, destination, promote = None):
@@ -479,6 +466,12 @@ class Game:
         self.hasToMove = Color.WHITE
         self.moves = OrderedDict()
         self.nbMoves = 1
+        self.halfMoves = 0 # half moves since last capture or pawn move, for fifty moves rule
+        self.positions = {} # number of occurrences of each position, for threefold repetition
+
+        # an empty game is filled afterwards, its initial position has to be recorded then
+        if not empty:
+            self.recordPosition()
 
     def move(self, origin, destination, promote = None):
         piece = self.board.squares[origin].piece
@@ -489,16 +482,20 @@ class Game:
         if piece.color is not self.hasToMove:
             raise ValueError('bad color')
 
+        capture = self.board.squares[destination].piece is not None
+
         if not piece.moveTo(destination, promote = promote):
             raise ValueError('movement not allowed')
 
+        self.halfMoves = 0 if capture or type(piece) is Pawn else self.halfMoves + 1
+
         # promote
-        if piece is Pawn and destination[1] in ['1', '8']:
+        if type(piece) is Pawn and promote and destination[1] in ['1', '8']:
             piece = promote(self, piece.color, destination)
             piece.square = self.board.squares[destination]
             self.board.squares[destination].piece = piece
 
-            for i in range(0, len(self.players[piece.color].pieces) - 1):
+            for i in range(0, len(self.players[piece.color].pieces)):
                 if self.players[piece.color].pieces[i].square.coords == destination:
                     self.players[piece.color].pieces[i] = piece
 
@@ -511,6 +508,13 @@ class Game:
         if self.hasToMove is Color.WHITE:
             self.nbMoves += 1
 
+        self.recordPosition()
+
+    def recordPosition(self):
+        "Count an occurrence of the current position, for threefold repetition"
+        key = self.positionKey()
+        self.positions[key] = self.positions.get(key, 0) + 1
+
 
     def currentPlayerInCheck(self):
         "Check whether the current player in check"
@@ -522,5 +526,56 @@ class Game:
     def currentPlayerInStalemate(self):
         return self.players[self.hasToMove].inStalemate()
 
+    def drawByFiftyMoves(self):
+        return self.halfMoves >= 100
+
+    def drawByRepetition(self):
+        return self.positions.get(self.positionKey(), 0) >= 3
+
+    def drawByInsufficientMaterial(self):
+        "Only kings remain, possibly with a single bishop or knight"
+        pieces = [ piece for player in self.players.values() for piece in player.pieces if type(piece) is not King ]
+
+        return len(pieces) == 0 or (len(pieces) == 1 and type(pieces[0]) in [ Bishop, Knight ])
+
+    def draw(self):
+        return self.drawByFiftyMoves() or self.drawByRepetition() or self.drawByInsufficientMaterial()
+
+    def positionKey(self):
+        "Identify the position: pieces placement, player to move, castling rights and en passant square"
+        rows = []
+        for i in reversed(list(char_range('1', '8'))):
+            row = ''
+            for j in char_range('a', 'h'):
+                piece = self.board.squares[(j, i)].piece
+                if piece is None:
+                    row += '.'
+                else:
+                    letter = 'n' if type(piece) is Knight else type(piece).__name__.lower()[0]
+                    row += letter.upper() if piece.color is Color.WHITE else letter
+            rows.append(row)
+
+        castling = ''
+        for color in [ Color.WHITE, Color.BLACK ]:
+            player = self.players[color]
+            king = player.king()
+            if king is None or king.nbMoves > 0:
+                continue
+            for column, letter in [ ('h', 'k'), ('a', 'q') ]:
+                piece = self.board.squares[(column, player.piecesLine)].piece
+                if type(piece) is Rook and piece.color is color and piece.nbMoves == 0:
+                    castling += letter.upper() if color is Color.WHITE else letter
+
+        # en passant square, only when a pawn can legally capture there
+        enPassant = '-'
+        for piece in list(self.players[self.hasToMove].pieces):
+            if type(piece) is Pawn:
+                for square in piece.enPassantMoves():
+                    if piece.moveTo(square.coords, tryMove = True):
+                        enPassant = '{}{}'.format(*square.coords)
+
+        return '/'.join(rows) + ' ' + ('w' if self.hasToMove is Color.WHITE else 'b') + ' ' + (castling or '-') \
+            + ' ' + enPassant
+
     def lastMove(self):
-        return self.moves[list(self.moves)[-1]] if len(self.moves) > 0 else False
\ No newline at end of file
+        return next(reversed(self.moves.values())) if len(self.moves) > 0 else False
\ No newline at end of file
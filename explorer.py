@@ -0,0 +1,231 @@
+# opening explorer: moves statistics per position, built from a games corpus
+
+from elements import *
+from selfplay import uciToMove, parseGame
+import getopt
+import hashlib
+import heapq
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+magic = b'CHESSIDX'
+
+# position key hash, move, number of games, white wins, draws, black wins
+record = struct.Struct('<8s5sIIII')
+
+results = {
+    '1-0': (1, 0, 0),
+    '1/2-1/2': (0, 1, 0),
+    '0-1': (0, 0, 1)
+}
+
+
+def hashPosition(game):
+    return hashlib.blake2b(game.positionKey().encode(), digest_size = 8).digest()
+
+
+def replay(moves):
+    "Replay moves through a new game, yields position hash and move played for each position, until a wrong move"
+    game = Game()
+
+    for moveStr in moves:
+        mv = uciToMove(moveStr)
+        if not mv:
+            return
+
+        key = hashPosition(game)
+
+        try:
+            game.move(*mv)
+        except ValueError:
+            return
+
+        yield key, moveStr.lower().encode()
+
+        game.opponentToPlay()
+
+
+def writeRun(counts, directory):
+    "Write aggregated counts sorted by position and move, returns file path"
+    fd, path = tempfile.mkstemp(dir = directory, suffix = '.run')
+    with os.fdopen(fd, 'wb') as f:
+        for key, move in sorted(counts):
+            f.write(record.pack(key, move, *counts[(key, move)]))
+
+    return path
+
+
+def readRun(path):
+    "Iterate over the records of a run file"
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(record.size * 4096)
+            if not data:
+                return
+            yield from record.iter_unpack(data)
+
+
+def mergeRuns(paths, f):
+    "Merge sorted run files into f, summing counts of identical position and move"
+    current = None
+    for rec in heapq.merge(*[ readRun(path) for path in paths ]):
+        if current and current[:2] == rec[:2]:
+            current = current[:2] + tuple(a + b for a, b in zip(current[2:], rec[2:]))
+            continue
+
+        if current:
+            f.write(record.pack(*current))
+        current = rec
+
+    if current:
+        f.write(record.pack(*current))
+
+
+def build(corpus, path, chunkSize = 1000000, fanIn = 64, tmpDir = None):
+    """Build an index file from corpus, an iterable of lines written by selfplay.formatGame.
+
+    Counts are aggregated in memory up to chunkSize distinct (position, move) pairs, then
+    written to sorted run files merged at the end, so that the corpus may exceed memory."""
+    with tempfile.TemporaryDirectory(dir = tmpDir) as directory:
+        runs = []
+        counts = {}
+
+        for line in corpus:
+            if not line.strip():
+                continue
+
+            seed, result, termination, moves = parseGame(line)
+            tally = results.get(result, (0, 0, 0))
+
+            # a game counts once for a position and move, even when the position is repeated
+            for key in set(replay(moves)):
+                total = counts.get(key, (0, 0, 0, 0))
+                counts[key] = (total[0] + 1, total[1] + tally[0], total[2] + tally[1], total[3] + tally[2])
+
+            if len(counts) >= chunkSize:
+                runs.append(writeRun(counts, directory))
+                counts = {}
+
+        if counts or not runs:
+            runs.append(writeRun(counts, directory))
+
+        # merge by groups to stay below open files limit
+        while len(runs) > fanIn:
+            merged = []
+            for i in range(0, len(runs), fanIn):
+                fd, runPath = tempfile.mkstemp(dir = directory, suffix = '.run')
+                with os.fdopen(fd, 'wb') as f:
+                    mergeRuns(runs[i:i + fanIn], f)
+                for run in runs[i:i + fanIn]:
+                    os.remove(run)
+                merged.append(runPath)
+            runs = merged
+
+        with open(path, 'wb') as f:
+            f.write(magic)
+            mergeRuns(runs, f)
+
+
+class OpeningIndex:
+    "Memory mapped index, looked up by binary search on position hash"
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+
+        if self.data[:len(magic)] != magic:
+            self.close()
+            raise ValueError('not an opening index')
+
+        self.size = (len(self.data) - len(magic)) // record.size
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def key(self, i):
+        offset = len(magic) + i * record.size
+        return self.data[offset:offset + 8]
+
+    def moves(self, key):
+        "List (move, games, white wins, draws, black wins) for a position hash, most played first"
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        moves = []
+        while low < self.size and self.key(low) == key:
+            rec = record.unpack_from(self.data, len(magic) + low * record.size)
+            moves.append((rec[1].rstrip(b'\0').decode(),) + rec[2:])
+            low += 1
+
+        return sorted(moves, key = lambda move: -move[1])
+
+    def lookup(self, game):
+        return self.moves(hashPosition(game))
+
+
+def usage():
+    print ('Help message : -h or --help' )
+    print ('Build index : -b games.txt -i games.idx  or  --build=games.txt --index=games.idx' )
+    print ('Query index : -i games.idx -m "e2e4 e7e5"  or  --index=games.idx --moves="e2e4 e7e5"' )
+
+
+def printError():
+    print ('Wrong syntax')
+    usage()
+
+
+if __name__ == '__main__':
+    try:
+        opts, arg = getopt.getopt(sys.argv[1:], "hb:i:m:", ["help", "build=", "index=", "moves="])
+    except getopt.GetoptError:
+        printError()
+        sys.exit(2)
+
+    opts = dict(opts)
+
+    if '-h' in opts or '--help' in opts:
+        usage()
+        sys.exit(0)
+
+    index = opts.get('-i', opts.get('--index'))
+    corpus = opts.get('-b', opts.get('--build'))
+
+    if not index:
+        printError()
+        sys.exit(2)
+
+    if corpus:
+        with open(corpus) as f:
+            build(f, index)
+        sys.exit(0)
+
+    game = Game()
+    for moveStr in opts.get('-m', opts.get('--moves', '')).split():
+        mv = uciToMove(moveStr)
+        try:
+            if not mv:
+                raise ValueError('wrong move syntax')
+            game.move(*mv)
+        except ValueError as e:
+            print('{}: {}'.format(moveStr, e))
+            sys.exit(2)
+        game.opponentToPlay()
+
+    with OpeningIndex(index) as explorer:
+        print('Move   Games   White  Draws  Black')
+        for move in explorer.lookup(game):
+            print('{:<6} {:>5} {:>7} {:>6} {:>6}'.format(*move))
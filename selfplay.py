@@ -0,0 +1,211 @@
+# self-play games generation
+
+from elements import *
+import multiprocessing
+import random
+import re
+
+promotions = {
+    'q': Queen,
+    'r': Rook,
+    'b': Bishop,
+    'n': Knight
+}
+
+values = {
+    Pawn: 1,
+    Knight: 3,
+    Bishop: 3,
+    Rook: 5,
+    Queen: 9,
+    King: 0
+}
+
+# weighted opening lines used when no book file is given
+defaultBook = [
+    (40, 'e2e4 e7e5 g1f3 b8c6 f1b5 a7a6'),
+    (25, 'e2e4 c7c5 g1f3 d7d6 d2d4 c5d4 f3d4 g8f6'),
+    (10, 'e2e4 e7e6 d2d4 d7d5'),
+    (25, 'd2d4 d7d5 c2c4 e7e6 b1c3 g8f6'),
+    (15, 'd2d4 g8f6 c2c4 g7g6 b1c3 f8g7'),
+    (10, 'c2c4 e7e5 b1c3 g8f6'),
+    (10, 'g1f3 d7d5 g2g3 g8f6'),
+]
+
+
+def moveToUci(origin, destination, promote = None):
+    "Format a move in long algebraic notation, e.g. e7e8q"
+    token = ''
+    for letter, piece in promotions.items():
+        if piece is promote:
+            token = letter
+
+    return '{}{}{}{}'.format(*origin, *destination) + token
+
+
+def uciToMove(moveStr):
+    "Parse a move in long algebraic notation, returns False if syntax is wrong"
+    matches = re.search(r"^\s*([a-h])([1-8])([a-h])([1-8])([qbnr])?\s*$", moveStr, re.IGNORECASE)
+
+    if matches is None:
+        return False
+
+    return (matches.group(1), matches.group(2)), (matches.group(3), matches.group(4)), \
+        promotions[matches.group(5).lower()] if matches.group(5) else None
+
+
+def playedMoves(game):
+    "Moves played so far in the game, in long algebraic notation"
+    return [ moveToUci(move.origin, move.destination, move.promote) for move in game.moves.values() ]
+
+
+def legalMoves(game):
+    "List legal moves of the player to move as (origin, destination, promote) tuples"
+    moves = []
+    for piece, square in game.players[game.hasToMove].iterLegalMoves():
+        if type(piece) is Pawn and square.coords[1] in ['1', '8']:
+            moves += [ (piece.square.coords, square.coords, promote) for promote in promotions.values() ]
+        else:
+            moves.append((piece.square.coords, square.coords, None))
+
+    # pieces order changes as captures are tried and cancelled,
+    # sort moves so that a game is fully determined by its seed
+    return sorted(moves, key = lambda move: moveToUci(*move))
+
+
+class RandomSelector:
+    "Play any legal move"
+    def choose(self, game, moves, rng):
+        return rng.choice(moves)
+
+
+class GreedySelector:
+    "One ply search: prefer winning material, avoid moving pieces to squares controlled by opponent"
+    def score(self, game, move):
+        piece = game.board.squares[move[0]].piece
+        destination = game.board.squares[move[1]]
+        score = values[type(destination.piece)] if destination.piece else 0
+
+        if move[2]:
+            score += values[move[2]] - values[Pawn]
+
+        if destination.controlledBy(piece.opponent()):
+            score -= values[move[2] or type(piece)]
+
+        return score
+
+    def choose(self, game, moves, rng):
+        scores = [ self.score(game, move) for move in moves ]
+        best = max(scores)
+
+        return rng.choice([ move for move, score in zip(moves, scores) if score == best ])
+
+
+class BookSelector:
+    "Follow weighted opening lines while the game stays in book, then use a fallback selector"
+    def __init__(self, lines = None, fallback = None):
+        self.lines = [ (weight, line.split()) for weight, line in (lines or defaultBook) ]
+        self.fallback = fallback or RandomSelector()
+
+    @staticmethod
+    def load(path, fallback = None):
+        "Read a book file: one line per opening, a weight followed by moves, e.g. '40 e2e4 e7e5'"
+        lines = []
+        with open(path) as f:
+            for row in f:
+                row = row.split('#')[0].split()
+                if row:
+                    lines.append((int(row[0]), ' '.join(row[1:])))
+
+        return BookSelector(lines, fallback)
+
+    def choose(self, game, moves, rng):
+        played = playedMoves(game)
+        legal = { moveToUci(*move): move for move in moves }
+
+        # sum weights of lines continuing the current game
+        weights = {}
+        for weight, line in self.lines:
+            if len(line) > len(played) and line[:len(played)] == played and line[len(played)] in legal:
+                weights[line[len(played)]] = weights.get(line[len(played)], 0) + weight
+
+        if not weights:
+            return self.fallback.choose(game, moves, rng)
+
+        candidates = sorted(weights)
+
+        return legal[rng.choices(candidates, [ weights[move] for move in candidates ])[0]]
+
+
+selectors = {
+    'random': RandomSelector,
+    'greedy': GreedySelector,
+    'book': BookSelector
+}
+
+
+def playGame(seed, selector, maxPlies = 400):
+    "Play a whole game, returns result, termination reason and moves played"
+    rng = random.Random(seed)
+    game = Game()
+
+    while True:
+        moves = legalMoves(game)
+
+        if not moves:
+            if game.currentPlayerCheckmated():
+                return ('0-1' if game.hasToMove is Color.WHITE else '1-0'), 'checkmate', playedMoves(game)
+            return '1/2-1/2', 'stalemate', playedMoves(game)
+
+        if game.drawByInsufficientMaterial():
+            return '1/2-1/2', 'material', playedMoves(game)
+
+        if game.drawByFiftyMoves():
+            return '1/2-1/2', 'fifty', playedMoves(game)
+
+        if game.drawByRepetition():
+            return '1/2-1/2', 'repetition', playedMoves(game)
+
+        if len(game.moves) >= maxPlies:
+            return '*', 'plies', playedMoves(game)
+
+        game.move(*selector.choose(game, moves, rng))
+        game.opponentToPlay()
+
+
+def formatGame(seed, result, termination, moves):
+    "One line per game: seed, result, termination reason and moves"
+    return ' '.join([ str(seed), result, termination ] + moves)
+
+
+def parseGame(line):
+    "Read a line written by formatGame, returns seed, result, termination and moves"
+    fields = line.split()
+
+    return int(fields[0]), fields[1], fields[2], fields[3:]
+
+
+# state of pool workers, set once by initWorker
+worker = {}
+
+def initWorker(selector, maxPlies):
+    worker['selector'] = selector
+    worker['maxPlies'] = maxPlies
+
+
+def playWorkerGame(seed):
+    return formatGame(seed, *playGame(seed, worker['selector'], worker['maxPlies']))
+
+
+def generate(nbGames, output, selector = None, workers = None, seed = 0, maxPlies = 400):
+    """Play nbGames games across a pool of processes and write them to output as they finish.
+
+    Game i is played with seed + i whatever the worker playing it, and games are written
+    in this order, so that the output only depends on the seed."""
+    selector = selector or RandomSelector()
+    seeds = range(seed, seed + nbGames)
+
+    with multiprocessing.Pool(workers, initializer = initWorker, initargs = (selector, maxPlies)) as pool:
+        for line in pool.imap(playWorkerGame, seeds):
+            output.write(line + '\n')
+            output.flush()